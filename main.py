@@ -5,8 +5,24 @@ import time
 import datetime
 import os
 import sys
-from collections import deque
 import json
+import mmap
+import struct
+import functools
+import queue
+import threading
+
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+try:
+    from scipy.optimize import linear_sum_assignment
+    HAS_SCIPY = True
+except ImportError:
+    HAS_SCIPY = False
 
 # Force headless behaviour; Pi screen no longer used
 HAS_DISPLAY = False
@@ -25,12 +41,21 @@ THERMAL_DELTA_RAW = int(DELTA_TEMP_C * 64)
 
 BG_UPDATE_ALPHA = 0.01
 MIN_HOT_AREA = 30
+
+# Use OpenCV's MOG2 background model instead of the built-in EWMA one.
+# MOG2 also learns multi-modal backgrounds (e.g. swaying warm branches).
+USE_MOG2_BACKGROUND = False
 SPLIT_DISTANCE_PX = 20
 
 PRE_ROLL_SEC = 10
 POST_ROLL_SEC = 10
 PHOTO_INTERVAL_SEC = 20
 
+# Live preview JPEG for the web UI is refreshed at most this often
+LIVE_JPEG_INTERVAL_SEC = 0.2
+# status JSON for the web UI is rewritten at most this often
+STATUS_INTERVAL_SEC = 1.0
+
 TRACK_FORGET_SEC = POST_ROLL_SEC
 TRACK_MAX_DIST = 40 * 40
 
@@ -38,6 +63,17 @@ TRACK_MAX_DIST = 40 * 40
 VIDEO_SCALE = DISPLAY_SCALE
 VIDEO_SIZE = (WIDTH * VIDEO_SCALE, HEIGHT * VIDEO_SCALE)
 
+# Frames each video writer may have queued for its encoder thread before
+# the oldest pending frame is dropped
+WRITER_QUEUE_FRAMES = CAMERA_FPS
+
+# Try the V4L2 M2M hardware H.264 encoder (via GStreamer) before the
+# software codecs. Only boards with an H.264 encode block (Pi 4 and
+# earlier) benefit; the Pi 5 has none. Needs OpenCV built with GStreamer
+# and a v4l2h264enc element. Probed once per run; software writers are
+# used if it is unavailable.
+USE_HW_ENCODER = False
+
 # Background reset flag (touched by web UI)
 RESET_FLAG_PATH = "/tmp/trailcam_reset_bg"
 
@@ -48,6 +84,11 @@ AUTO_BG_RESET_IDLE_SEC = 60  # seconds of no objects before auto-reset
 ENABLE_VISUAL_SMOOTHING = False
 VISUAL_SMOOTH_ALPHA = 0.4  # 0–1, higher = more smoothing (and more lag)
 
+# Run morphology / resize / cvtColor (and MOG2) through OpenCV's OpenCL
+# T-API (cv2.UMat) when the OpenCV build has a working OpenCL device.
+# At 256x192 the upload/download can outweigh the win, so measure first.
+USE_OPENCL = False
+
 # ------------------------------------------------------------
 # STORAGE STRUCTURE (LOCAL, PERSISTENT ON SD CARD)
 # ------------------------------------------------------------
@@ -57,8 +98,16 @@ BASE_MEDIA_DIR = os.path.join("/home/kasper", "media")
 PHOTO_DIR = os.path.join(BASE_MEDIA_DIR, "photos")
 VIDEO_DIR = os.path.join(BASE_MEDIA_DIR, "videos")
 VIDEO_TRACKED_DIR = os.path.join(BASE_MEDIA_DIR, "videos_tracked")
-LIVE_JPEG_PATH = os.path.join(BASE_MEDIA_DIR, "live.jpg")
-STATUS_PATH = os.path.join(BASE_MEDIA_DIR, "status.json")
+
+# Live preview + status live in RAM (tmpfs) so they don't wear the SD card
+RUNTIME_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else BASE_MEDIA_DIR
+LIVE_JPEG_PATH = os.path.join(RUNTIME_DIR, "trailcam_live.jpg")
+STATUS_PATH = os.path.join(RUNTIME_DIR, "trailcam_status.json")
+# Same status as a fixed 16-byte record, mmap'd by the web UI:
+# recording (u8), 3 pad bytes, events (u32 LE), rest reserved
+STATUS_SHM_PATH = os.path.join(RUNTIME_DIR, "trailcam_status")
+STATUS_SHM_FMT = "<BxxxI"
+STATUS_SHM_SIZE = 16
 
 # Armed/disarmed state (toggled by web UI)
 ARMED_STATE_PATH = os.path.join(BASE_MEDIA_DIR, "armed_state.json")
@@ -132,6 +181,8 @@ def open_tc001_capture():
 
         cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
         cap.set(cv2.CAP_PROP_FPS, CAMERA_FPS)
+        # small V4L2 queue keeps latency low; read() blocks until a frame
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 2)
         time.sleep(0.3)
 
         ret, frame = cap.read()
@@ -153,183 +204,278 @@ def open_tc001_capture():
 # TC001 DECODE (dual-layout)
 # ------------------------------------------------------------
 
-def decode_visual(frame):
+def decode_frame(frame):
     """
-    Returns 8-bit visual grayscale (HEIGHT x WIDTH).
+    Returns (visual, thermal_raw) from one camera frame, slicing it once:
+      visual      = 8-bit grayscale (HEIGHT x WIDTH), a read-only view
+      thermal_raw = 16-bit raw (HEIGHT x WIDTH)
     Handles:
-      A) Pi stacked 256x384 YUYV (take top half luma)
+      A) Pi stacked 256x384 YUYV (top half luma, bottom half thermal)
       B) Windows-style packed row (split row into halves)
     """
     h, w = frame.shape[:2]
 
     # Layout A: stacked 256x384 (or similar)
     if h >= HEIGHT * 2 and w == WIDTH:
-        top = frame[:HEIGHT, :, :]
-        if top.ndim == 3 and top.shape[2] >= 1:
-            return top[:, :, 0].copy()
-        return top.copy()
+        top = frame[:HEIGHT]
+        bottom = frame[HEIGHT:HEIGHT * 2]
+        if frame.ndim == 3 and frame.shape[2] >= 2:
+            visual = top[:, :, 0]
+            # YUYV byte pairs are already little-endian uint16 (low, high)
+            pairs = np.ascontiguousarray(bottom[:, :, :2])
+            thermal = pairs.view(np.uint16).reshape(HEIGHT, WIDTH)
+        else:
+            visual = top[:, :, 0] if top.ndim == 3 else top
+            th = np.frombuffer(bottom.tobytes(), dtype=np.uint16, count=WIDTH * HEIGHT)
+            thermal = th.reshape(HEIGHT, WIDTH)
+        return visual, thermal
 
     # Layout B: packed single row carrying visual + thermal
     row = frame[0]
-    im_row, _ = np.array_split(row, 2)
+    im_row, th_row = np.array_split(row, 2)
     imdata = np.frombuffer(im_row, dtype=np.uint8).reshape(HEIGHT, WIDTH, 2)
-    return imdata[:, :, 0]
-
-def decode_thermal_raw(frame):
-    """
-    Returns 16-bit thermal raw (HEIGHT x WIDTH).
-    Layout A: stacked 256x384 YUYV, thermal in bottom half (2 bytes per pixel).
-    Layout B: packed row split.
-    """
-    h, w = frame.shape[:2]
-
-    # Layout A: stacked
-    if h >= HEIGHT * 2 and w == WIDTH:
-        bottom = frame[HEIGHT:HEIGHT * 2, :, :]
-        if bottom.ndim == 3 and bottom.shape[2] >= 2:
-            low = bottom[:, :, 0].astype(np.uint16)
-            high = bottom[:, :, 1].astype(np.uint16)
-            return low + (high << 8)
-        buf = bottom.tobytes()
-        th = np.frombuffer(buf, dtype=np.uint16, count=WIDTH * HEIGHT)
-        return th.reshape(HEIGHT, WIDTH)
-
-    # Layout B: packed
-    row = frame[0]
-    _, th_row = np.array_split(row, 2)
-    thdata = np.frombuffer(th_row, dtype=np.uint8).reshape(HEIGHT, WIDTH, 2)
-    low = thdata[:, :, 0].astype(np.uint16)
-    high = thdata[:, :, 1].astype(np.uint16)
-    return low + (high << 8)
+    th_row = np.ascontiguousarray(th_row, dtype=np.uint8)
+    return imdata[:, :, 0], th_row.view(np.uint16).reshape(HEIGHT, WIDTH)
 
 # ------------------------------------------------------------
 # HOT OBJECT SEGMENTATION
 # ------------------------------------------------------------
 
-def detect_hot_objects(thermal_raw, background):
-    delta = thermal_raw.astype(np.int32) - background.astype(np.int32)
-    hot_mask = delta > THERMAL_DELTA_RAW
-
-    new_bg = background.copy()
-    cold = ~hot_mask
-    new_bg[cold] = (1.0 - BG_UPDATE_ALPHA) * new_bg[cold] + BG_UPDATE_ALPHA * thermal_raw[cold]
-
-    mask_u8 = (hot_mask.astype(np.uint8) * 255)
-    kernel = np.ones((3, 3), np.uint8)
-    mask_u8 = cv2.morphologyEx(mask_u8, cv2.MORPH_OPEN, kernel, iterations=1)
-    mask_u8 = cv2.dilate(mask_u8, kernel, iterations=2)
-    contours, _ = cv2.findContours(mask_u8, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+if HAS_NUMBA:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _update_bg_and_mask(thermal, background, mask_u8, delta_raw, alpha):
+        """
+        Single pass over the frame: threshold against the background into
+        mask_u8 and blend cold pixels into background (both in place).
+        Returns the number of hot pixels.
+        """
+        h, w = thermal.shape
+        n_hot = 0
+        for y in prange(h):
+            for x in range(w):
+                t = thermal[y, x]
+                b = background[y, x]
+                if np.int32(t) - np.int32(b) > delta_raw:
+                    mask_u8[y, x] = 255
+                    n_hot += 1
+                else:
+                    background[y, x] = b + alpha * (t - b)
+                    mask_u8[y, x] = 0
+        return n_hot
+else:
+    def _update_bg_and_mask(thermal, background, mask_u8, delta_raw, alpha):
+        """NumPy fallback for the fused Numba kernel (same in-place result)."""
+        # int16 delta: wrap-around subtraction is exact while |delta| < 32768,
+        # at half the memory traffic of int32 temporaries
+        bg_int = background.astype(np.uint16)
+        delta = np.subtract(thermal.view(np.int16), bg_int.view(np.int16))
+        hot = delta > delta_raw
+        cold = ~hot
+        background[cold] += alpha * (thermal[cold] - background[cold])
+        np.multiply(hot, 255, out=mask_u8, casting="unsafe")
+        return int(np.count_nonzero(hot))
+
+# Mask cleanup: open with 3x3, then dilate twice more with 3x3. The three
+# 3x3 dilations collapse into one 7x7 dilation (same result, one pass).
+SE3 = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+SE7 = cv2.getStructuringElement(cv2.MORPH_RECT, (7, 7))
+
+OPENCL_ACTIVE = USE_OPENCL and cv2.ocl.haveOpenCL()
+cv2.ocl.setUseOpenCL(OPENCL_ACTIVE)
+
+def make_bg_subtractor():
+    """
+    MOG2 model fed with raw thermal as float32. Variance is pinned to 1 so
+    varThreshold is simply the squared raw delta (THERMAL_DELTA_RAW).
+    """
+    sub = cv2.createBackgroundSubtractorMOG2(
+        history=int(1.0 / BG_UPDATE_ALPHA),
+        varThreshold=float(THERMAL_DELTA_RAW * THERMAL_DELTA_RAW),
+        detectShadows=False,
+    )
+    sub.setVarInit(1.0)
+    sub.setVarMin(1.0)
+    sub.setVarMax(1.0)
+    return sub
+
+def reset_background(background, thermal_raw, bg_sub=None):
+    """Re-seed the background model(s) from the current thermal frame."""
+    np.copyto(background, thermal_raw)
+    if bg_sub is not None:
+        bg_sub.apply(thermal_raw.astype(np.float32), learningRate=1.0)
+
+def detect_hot_objects(thermal_raw, background, mask_u8=None, morph_tmp=None,
+                       bg_sub=None):
+    """
+    Segment hot blobs against the float32 background, which is updated
+    in place (or against bg_sub, a MOG2 model, when given). mask_u8 /
+    morph_tmp are optional HEIGHT x WIDTH uint8 scratch buffers.
+    Returns (bboxes, background) where bboxes is an N x 4 int32 array of
+    (x, y, w, h) for every blob of at least MIN_HOT_AREA pixels.
+    """
+    if mask_u8 is None:
+        mask_u8 = np.empty(thermal_raw.shape, np.uint8)
+    if morph_tmp is None:
+        morph_tmp = np.empty(thermal_raw.shape, np.uint8)
+    mask_um = None
+    if bg_sub is not None and OPENCL_ACTIVE:
+        # stay on the device from background model through morphology
+        mask_um = bg_sub.apply(cv2.UMat(thermal_raw.astype(np.float32)))
+        n_hot = cv2.countNonZero(mask_um)
+    elif bg_sub is not None:
+        bg_sub.apply(thermal_raw.astype(np.float32), mask_u8)
+        n_hot = cv2.countNonZero(mask_u8)
+    else:
+        n_hot = _update_bg_and_mask(thermal_raw, background, mask_u8,
+                                    THERMAL_DELTA_RAW, BG_UPDATE_ALPHA)
+
+    # nothing above threshold (the usual case): skip morphology + labelling
+    if n_hot == 0:
+        return np.empty((0, 4), np.int32), background
+
+    if OPENCL_ACTIVE:
+        if mask_um is None:
+            mask_um = cv2.UMat(mask_u8)
+        mask_um = cv2.dilate(cv2.erode(mask_um, SE3), SE7)
+        np.copyto(mask_u8, mask_um.get())
+    else:
+        cv2.erode(mask_u8, SE3, dst=morph_tmp, iterations=1)
+        cv2.dilate(morph_tmp, SE7, dst=mask_u8, iterations=1)
 
-    detections = []
-    for c in contours:
-        if cv2.contourArea(c) < MIN_HOT_AREA:
-            continue
-        x, y, w, h = cv2.boundingRect(c)
-        detections.append({"bbox": (x, y, w, h), "cx": x + w / 2, "cy": y + h / 2})
+    _, _, stats, _ = cv2.connectedComponentsWithStats(mask_u8, connectivity=8)
+    stats = stats[1:]  # label 0 is the background
+    keep = stats[:, cv2.CC_STAT_AREA] >= MIN_HOT_AREA
+    bboxes = stats[keep, :cv2.CC_STAT_AREA].astype(np.int32)
 
-    return detections, new_bg
+    return bboxes, background
 
 # ------------------------------------------------------------
 # MERGE CLOSE / OVERLAPPING BLOBS
 # ------------------------------------------------------------
 
-def _rects_intersect(b1, b2, pad=0):
-    x1, y1, w1, h1 = b1
-    x2, y2, w2, h2 = b2
-    a1x1, a1y1, a1x2, a1y2 = x1 - pad, y1 - pad, x1 + w1 + pad, y1 + h1 + pad
-    a2x1, a2y1, a2x2, a2y2 = x2 - pad, y2 - pad, x2 + w2 + pad, y2 + h2 + pad
-    return not (a1x2 < a2x1 or a2x2 < a1x1 or a1y2 < a2y1 or a2y2 < a1y1)
-
-def _union_bbox(b1, b2):
-    x1, y1, w1, h1 = b1
-    x2, y2, w2, h2 = b2
-    xa1, ya1, xa2, ya2 = x1, y1, x1 + w1, y1 + h1
-    xb1, yb1, xb2, yb2 = x2, y2, x2 + w2, y2 + h2
-    x = min(xa1, xb1)
-    y = min(ya1, yb1)
-    xe = max(xa2, xb2)
-    ye = max(ya2, yb2)
-    return (x, y, xe - x, ye - y)
-
-def merge_detections(detections):
-    dets = [d.copy() for d in detections]
-
-    changed = True
-    while changed:
-        changed = False
-        out = []
-        used = [False] * len(dets)
-
-        for i in range(len(dets)):
-            if used[i]:
-                continue
-            b1 = dets[i]["bbox"]
-
-            merged_bbox = b1
-            used[i] = True
-
-            for j in range(i + 1, len(dets)):
-                if used[j]:
-                    continue
-                b2 = dets[j]["bbox"]
-                overlap = _rects_intersect(merged_bbox, b2, pad=0)
-                cx1 = merged_bbox[0] + merged_bbox[2] / 2
-                cy1 = merged_bbox[1] + merged_bbox[3] / 2
-                cx2 = b2[0] + b2[2] / 2
-                cy2 = b2[1] + b2[3] / 2
-                dx = cx1 - cx2
-                dy = cy1 - cy2
-                close = (dx * dx + dy * dy) ** 0.5 < SPLIT_DISTANCE_PX
-
-                if close or overlap:
-                    merged_bbox = _union_bbox(merged_bbox, b2)
-                    used[j] = True
-                    changed = True
-
-            x, y, w, h = merged_bbox
-            out.append(
-                {
-                    "bbox": merged_bbox,
-                    "cx": x + w / 2,
-                    "cy": y + h / 2,
-                }
-            )
+def _merge_pass(boxes):
+    """
+    One vectorized merge pass over an N x 4 array of (x0, y0, x1, y1) boxes.
+    Boxes that overlap/touch or whose centers are closer than
+    SPLIT_DISTANCE_PX are joined into connected components, and each
+    component is replaced by its enclosing box (ordered by first member).
+    """
+    n = len(boxes)
+    x0, y0, x1, y1 = boxes.T
+    cx = (x0 + x1) / 2.0
+    cy = (y0 + y1) / 2.0
+
+    d2 = (cx[:, None] - cx[None, :]) ** 2 + (cy[:, None] - cy[None, :]) ** 2
+    overlap = (
+        (x0[:, None] <= x1[None, :]) & (x0[None, :] <= x1[:, None]) &
+        (y0[:, None] <= y1[None, :]) & (y0[None, :] <= y1[:, None])
+    )
+    adj = (d2 < SPLIT_DISTANCE_PX * SPLIT_DISTANCE_PX) | overlap
+
+    # label propagation: every box ends up labelled with the lowest index
+    # in its connected component
+    labels = np.arange(n)
+    while True:
+        new_labels = np.where(adj, labels[None, :], n).min(axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+    order = np.argsort(labels, kind="stable")
+    sorted_labels = labels[order]
+    starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+    b = boxes[order]
+    return np.stack(
+        [
+            np.minimum.reduceat(b[:, 0], starts),
+            np.minimum.reduceat(b[:, 1], starts),
+            np.maximum.reduceat(b[:, 2], starts),
+            np.maximum.reduceat(b[:, 3], starts),
+        ],
+        axis=1,
+    )
+
+def merge_detections(bboxes):
+    """
+    Merge an N x 4 array of (x, y, w, h) blobs (from detect_hot_objects)
+    into detection dicts with "bbox", "cx" and "cy".
+    """
+    if len(bboxes) == 0:
+        return []
 
-        dets = out
+    boxes = np.column_stack(
+        (bboxes[:, 0], bboxes[:, 1],
+         bboxes[:, 0] + bboxes[:, 2], bboxes[:, 1] + bboxes[:, 3])
+    )
 
+    # merged boxes can grow into new neighbours, so repeat until stable
+    while True:
+        merged = _merge_pass(boxes)
+        if len(merged) == len(boxes):
+            break
+        boxes = merged
+
+    dets = []
+    for x0, y0, x1, y1 in boxes.tolist():
+        w, h = x1 - x0, y1 - y0
+        dets.append({"bbox": (x0, y0, w, h), "cx": x0 + w / 2, "cy": y0 + h / 2})
     return dets
 
 # ------------------------------------------------------------
 # TRACKING
 # ------------------------------------------------------------
 
+@functools.lru_cache(maxsize=1024)
 def generate_color(tid):
-    rng = np.random.RandomState(tid * 9973 + 12345)
-    return tuple(int(x) for x in rng.randint(50, 255, 3))
+    """Deterministic per-ID colour from a multiplicative hash (no RNG)."""
+    h = (tid * 2654435761) & 0xFFFFFF
+    return (50 + h % 206, 50 + (h >> 8) % 206, 50 + (h >> 16) % 206)
+
+def _assign_tracks(track_xy, det_xy):
+    """
+    Match tracks to detections by squared center distance, gated by
+    TRACK_MAX_DIST. Returns (track_index, detection_index) pairs.
+    Uses the optimal Hungarian assignment when SciPy is available,
+    otherwise a global greedy match in order of increasing distance.
+    """
+    if len(track_xy) == 0 or len(det_xy) == 0:
+        return []
+
+    cost = ((track_xy[:, None, :] - det_xy[None, :, :]) ** 2).sum(-1)
+    allowed = cost < TRACK_MAX_DIST
+
+    if HAS_SCIPY:
+        # large finite penalty instead of inf keeps the problem feasible
+        rows, cols = linear_sum_assignment(np.where(allowed, cost, TRACK_MAX_DIST * 1e6))
+        return [(r, c) for r, c in zip(rows.tolist(), cols.tolist()) if allowed[r, c]]
+
+    pairs = []
+    used_t, used_d = set(), set()
+    for flat in np.argsort(cost, axis=None, kind="stable").tolist():
+        r, c = divmod(flat, cost.shape[1])
+        if not allowed[r, c]:
+            break
+        if r in used_t or c in used_d:
+            continue
+        used_t.add(r)
+        used_d.add(c)
+        pairs.append((r, c))
+    return pairs
 
 def update_tracks(detections, tracks, now):
     used = set()
     visible = []
 
-    for tid, t in list(tracks.items()):
-        best = -1
-        best_d2 = TRACK_MAX_DIST
-        for i, d in enumerate(detections):
-            if i in used:
-                continue
-            dx = d["cx"] - t["cx"]
-            dy = d["cy"] - t["cy"]
-            d2 = dx * dx + dy * dy
-            if d2 < best_d2:
-                best_d2 = d2
-                best = i
-
-        if best >= 0:
-            d = detections[best]
-            t["cx"], t["cy"], t["bbox"] = d["cx"], d["cy"], d["bbox"]
-            t["last"] = now
-            used.add(best)
-            visible.append((tid, t))
+    tids = list(tracks.keys())
+    track_xy = np.array([[tracks[tid]["cx"], tracks[tid]["cy"]] for tid in tids], np.float64)
+    det_xy = np.array([[d["cx"], d["cy"]] for d in detections], np.float64)
+
+    for r, c in sorted(_assign_tracks(track_xy, det_xy)):
+        tid, t, d = tids[r], tracks[tids[r]], detections[c]
+        t["cx"], t["cy"], t["bbox"] = d["cx"], d["cy"], d["bbox"]
+        t["last"] = now
+        used.add(c)
+        visible.append((tid, t))
 
     next_id = max([0] + list(tracks.keys())) + 1
     for i, d in enumerate(detections):
@@ -343,6 +489,8 @@ def update_tracks(detections, tracks, now):
             "bbox": d["bbox"],
             "last": now,
             "color": generate_color(tid),
+            # overlay label size is fixed per ID, so measure it once
+            "label_sz": cv2.getTextSize(f"ID{tid}", cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)[0],
         }
         visible.append((tid, tracks[tid]))
         log_track(f"New ID {tid} at ({d['cx']:.1f},{d['cy']:.1f})")
@@ -357,9 +505,47 @@ def update_tracks(detections, tracks, now):
 # VIDEO WRITER + HELPERS
 # ------------------------------------------------------------
 
+# None = not probed yet; False after a failed probe (skip from then on)
+_hw_encoder_ok = None
+
+def _gstreamer_available():
+    for line in cv2.getBuildInformation().splitlines():
+        if line.strip().startswith("GStreamer:"):
+            return "YES" in line
+    return False
+
+def _make_hw_writer(path_base, fps, size):
+    """H.264 through the V4L2 stateful encoder; returns None if unavailable."""
+    path = f"{path_base}.mp4"
+    pipeline = (
+        "appsrc ! videoconvert ! video/x-raw,format=I420 ! "
+        'v4l2h264enc extra-controls="controls,repeat_sequence_header=1" ! '
+        "video/x-h264,level=(string)4 ! h264parse ! mp4mux ! "
+        f"filesink location={path}"
+    )
+    w = cv2.VideoWriter(pipeline, cv2.CAP_GSTREAMER, 0, fps, size)
+    if w.isOpened():
+        return w
+    try:
+        w.release()
+    except Exception:
+        pass
+    return None
+
 def make_writer(path_base, fps, size):
+    global _hw_encoder_ok
     is_windows = sys.platform.startswith("win")
 
+    # runs on the capture thread as an event starts: once the pipeline has
+    # failed, don't rebuild it for every recording
+    if USE_HW_ENCODER and not is_windows and _hw_encoder_ok is not False:
+        w = _make_hw_writer(path_base, fps, size) if _gstreamer_available() else None
+        if w is not None:
+            _hw_encoder_ok = True
+            return w, "v4l2h264enc", "mp4"
+        _hw_encoder_ok = False
+        log_warn("Hardware H.264 encoder unavailable, using software codecs.")
+
     if is_windows:
         codecs_to_try = ("mp4v", "XVID", "MJPG")
     else:
@@ -382,9 +568,112 @@ def make_writer(path_base, fps, size):
 
     return None, None, None
 
-def upscale_gray_to_bgr(gray):
-    bgr = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
-    return cv2.resize(bgr, VIDEO_SIZE, interpolation=cv2.INTER_NEAREST)
+class AsyncVideoWriter:
+    """
+    Wraps a cv2.VideoWriter so encoding runs on a background thread and
+    never stalls capture. write() copies the frame into one of a small
+    pool of preallocated buffers; if the encoder falls behind, the oldest
+    pending frame is dropped (unless block=True). If the encoder raises
+    (full SD card, pipeline error) the thread records it and keeps
+    draining, so write() and release() never block on a dead writer.
+    """
+
+    def __init__(self, writer, size, max_pending=WRITER_QUEUE_FRAMES):
+        self.writer = writer
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.free = queue.Queue()
+        for _ in range(max_pending + 1):
+            self.free.put(np.empty((size[1], size[0], 3), np.uint8))
+        self.dropped = 0
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            buf = self.pending.get()
+            if buf is None:
+                break
+            if self.error is None:
+                try:
+                    self.writer.write(buf)
+                except Exception as e:
+                    self.error = e
+            self.free.put(buf)
+
+    def write(self, frame, block=False):
+        if block:
+            buf = self.free.get()
+        else:
+            try:
+                buf = self.free.get_nowait()
+            except queue.Empty:
+                # encoder is behind: recycle the oldest pending frame
+                try:
+                    buf = self.pending.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    buf = self.free.get()
+        np.copyto(buf, frame)
+        self.pending.put(buf)
+
+    def release(self):
+        """Flush pending frames, stop the thread and close the file."""
+        self.pending.put(None)
+        self.thread.join()
+        try:
+            self.writer.release()
+        except Exception:
+            pass
+        if self.error is not None:
+            log_warn(f"Encoder failed, recording is incomplete: {self.error}")
+        if self.dropped:
+            log_warn(f"Encoder fell behind, dropped {self.dropped} frame(s).")
+
+def upscale_gray_to_bgr(gray, out=None, tmp=None):
+    """
+    Upscale gray to VIDEO_SIZE (single channel), then expand to BGR.
+    Pass preallocated out (VIDEO_SIZE BGR) / tmp (VIDEO_SIZE gray) to
+    avoid allocations.
+    """
+    if OPENCL_ACTIVE:
+        big = cv2.resize(cv2.UMat(gray), VIDEO_SIZE, interpolation=cv2.INTER_NEAREST)
+        bgr = cv2.cvtColor(big, cv2.COLOR_GRAY2BGR).get()
+        if out is None:
+            return bgr
+        np.copyto(out, bgr)
+        return out
+    tmp = cv2.resize(gray, VIDEO_SIZE, dst=tmp, interpolation=cv2.INTER_NEAREST)
+    return cv2.cvtColor(tmp, cv2.COLOR_GRAY2BGR, dst=out)
+
+class FrameRing:
+    """
+    Fixed-capacity ring of preallocated frames, used for the pre-roll.
+    Iterates oldest -> newest.
+    """
+
+    def __init__(self, capacity, shape, dtype=np.uint8):
+        self.frames = np.empty((capacity,) + tuple(shape), dtype)
+        self.capacity = capacity
+        self.head = 0
+        self.count = 0
+
+    def append(self, frame):
+        np.copyto(self.frames[self.head], frame)
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        start = (self.head - self.count) % self.capacity
+        for i in range(self.count):
+            yield self.frames[(start + i) % self.capacity]
 
 def format_hhmmss(sec):
     sec = int(max(0, sec))
@@ -393,18 +682,67 @@ def format_hhmmss(sec):
     ss = sec % 60
     return f"{hh:02d}:{mm:02d}:{ss:02d}"
 
-def write_status(recording, events):
-    """Write lightweight JSON status for the web UI."""
+def write_live_jpeg(img):
+    """Encode img and atomically replace LIVE_JPEG_PATH with it."""
+    ok, buf = cv2.imencode(".jpg", img)
+    if not ok:
+        return
+    tmp_path = LIVE_JPEG_PATH + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(buf)
+        os.replace(tmp_path, LIVE_JPEG_PATH)
+    except Exception:
+        pass
+
+_last_status = None
+_last_status_write = 0.0
+_status_shm = None
+
+def _open_status_shm():
+    """Map STATUS_SHM_PATH read/write, creating it at STATUS_SHM_SIZE."""
+    fd = os.open(STATUS_SHM_PATH, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        os.ftruncate(fd, STATUS_SHM_SIZE)
+        return mmap.mmap(fd, STATUS_SHM_SIZE)
+    finally:
+        os.close(fd)
+
+def write_status(recording, events, force=False):
+    """
+    Publish status for the web UI. The shared-memory record is updated on
+    every call (a plain memory store). The JSON file is only rewritten when
+    the status changed, and at most once per STATUS_INTERVAL_SEC unless
+    force; a skipped change is picked up by the next call.
+    """
+    global _last_status, _last_status_write, _status_shm
+    status = (bool(recording), int(events))
+
+    try:
+        if _status_shm is None:
+            _status_shm = _open_status_shm()
+        struct.pack_into(STATUS_SHM_FMT, _status_shm, 0, status[0], status[1])
+    except Exception:
+        pass
+
+    now = time.time()
+    if not force:
+        if status == _last_status or now - _last_status_write < STATUS_INTERVAL_SEC:
+            return
+
     tmp_path = STATUS_PATH + ".tmp"
     data = {
-        "recording": bool(recording),
-        "events": int(events),
-        "ts": time.time(),
+        "recording": status[0],
+        "events": status[1],
+        "ts": now,
     }
     try:
         with open(tmp_path, "w") as f:
             json.dump(data, f)
+        # rename keeps readers from seeing a half-written file (cheap on tmpfs)
         os.replace(tmp_path, STATUS_PATH)
+        _last_status = status
+        _last_status_write = now
     except Exception:
         pass
 
@@ -413,6 +751,11 @@ def write_status(recording, events):
 # ------------------------------------------------------------
 
 def main():
+    # decode_frame() reinterprets thermal byte pairs as native uint16
+    if sys.byteorder != "little":
+        log_warn("Big-endian host not supported by thermal decode.")
+        return
+
     cap = open_tc001_capture()
     if cap is None:
         log_warn("Camera init failed. Check v4l2 devices.")
@@ -431,24 +774,37 @@ def main():
         return
 
     try:
-        visual = decode_visual(frame)
-        thermal = decode_thermal_raw(frame)
+        visual, thermal = decode_frame(frame)
     except Exception as e:
         log_warn(f"Initial decode failed: {e}")
         return
 
     background = thermal.astype(np.float32)
+    bg_sub = make_bg_subtractor() if USE_MOG2_BACKGROUND else None
+    if bg_sub is not None:
+        reset_background(background, thermal, bg_sub)
+        log_info("Using MOG2 background model.")
 
     # optional smoothing state
     vis_smooth = visual.astype(np.float32)
 
-    prebuffer = deque(maxlen=PRE_ROLL_SEC * CAMERA_FPS)
+    # scratch buffers reused every frame (no per-frame allocations)
+    scratch_vis = np.empty((HEIGHT, WIDTH), np.uint8)
+    scratch_mask = np.empty((HEIGHT, WIDTH), np.uint8)
+    scratch_morph = np.empty((HEIGHT, WIDTH), np.uint8)
+    scratch_gray_big = np.empty((VIDEO_SIZE[1], VIDEO_SIZE[0]), np.uint8)
+    scratch_bgr = np.empty((VIDEO_SIZE[1], VIDEO_SIZE[0], 3), np.uint8)
+
+    # pre-roll keeps native-resolution grayscale frames in one preallocated
+    # block; they are only upscaled if a recording actually starts
+    prebuffer = FrameRing(PRE_ROLL_SEC * CAMERA_FPS, (HEIGHT, WIDTH))
     tracks = {}
     recording = False
     raw_out = trk_out = None
 
     last_seen = 0
     last_photo_time = 0
+    last_live_write = 0
 
     recording_start_time = None
     recording_label = None
@@ -468,7 +824,7 @@ def main():
     idle_start = None
 
     # initial status for web UI
-    write_status(False, events_count)
+    write_status(False, events_count, force=True)
 
     log_info("TC001 Thermal Tracker running...")
     log_info(f"Media root: {BASE_MEDIA_DIR}")
@@ -483,8 +839,7 @@ def main():
 
         # decode safely; skip weird frames
         try:
-            visual = decode_visual(frame)
-            thermal = decode_thermal_raw(frame)
+            visual, thermal = decode_frame(frame)
             if visual.shape != (HEIGHT, WIDTH):
                 continue
         except Exception:
@@ -492,7 +847,7 @@ def main():
 
         # background reset trigger (from web UI)
         if os.path.exists(RESET_FLAG_PATH):
-            background = thermal.astype(np.float32)
+            reset_background(background, thermal, bg_sub)
             try:
                 os.remove(RESET_FLAG_PATH)
             except OSError:
@@ -501,23 +856,25 @@ def main():
 
         # update smoothing
         if ENABLE_VISUAL_SMOOTHING:
-            vis_smooth[:] = (1.0 - VISUAL_SMOOTH_ALPHA) * vis_smooth + VISUAL_SMOOTH_ALPHA * visual.astype(np.float32)
-            visual_out = vis_smooth.astype(np.uint8)
+            cv2.accumulateWeighted(visual, vis_smooth, VISUAL_SMOOTH_ALPHA)
+            np.copyto(scratch_vis, vis_smooth, casting="unsafe")
+            visual_out = scratch_vis
         else:
             visual_out = visual
 
-        prebuffer.append(visual_out.copy())
+        prebuffer.append(visual_out)
 
         # object detection/tracking uses thermal only
-        detections, background = detect_hot_objects(thermal, background)
+        detections, background = detect_hot_objects(
+            thermal, background, scratch_mask, scratch_morph, bg_sub
+        )
         merged = merge_detections(detections)
         tracks, visible = update_tracks(merged, tracks, now)
 
-        # write latest frame for web live-view (smoothed visual)
-        try:
-            cv2.imwrite(LIVE_JPEG_PATH, visual_out)
-        except Exception:
-            pass
+        # write latest frame for web live-view (smoothed visual), rate-limited
+        if now - last_live_write >= LIVE_JPEG_INTERVAL_SEC:
+            write_live_jpeg(visual_out)
+            last_live_write = now
 
         ids_now = sorted([tid for tid, _ in visible])
         objects_present = len(ids_now) > 0
@@ -530,7 +887,7 @@ def main():
             if idle_start is None:
                 idle_start = now
             elif now - idle_start >= AUTO_BG_RESET_IDLE_SEC:
-                background = thermal.astype(np.float32)
+                reset_background(background, thermal, bg_sub)
                 idle_start = now
                 log_info("Background auto-reset after idle period with no detections.")
 
@@ -582,11 +939,15 @@ def main():
                 raw_path = f"{raw_base}.{raw_ext}"
                 trk_path = f"{trk_base}.{trk_ext}"
 
-                # pre-roll frames
+                # encode on background threads so capture keeps its cadence
+                raw_out = AsyncVideoWriter(raw_out, VIDEO_SIZE)
+                trk_out = AsyncVideoWriter(trk_out, VIDEO_SIZE)
+
+                # pre-roll frames (blocking: never drop these)
                 for f in prebuffer:
-                    pre_scaled = upscale_gray_to_bgr(f)
-                    raw_out.write(pre_scaled)
-                    trk_out.write(pre_scaled)
+                    pre_scaled = upscale_gray_to_bgr(f, scratch_bgr, scratch_gray_big)
+                    raw_out.write(pre_scaled, block=True)
+                    trk_out.write(pre_scaled, block=True)
 
                 recording = True
                 last_seen = now
@@ -612,10 +973,12 @@ def main():
                 cv2.imwrite(photo_path, visual_out)
                 last_photo_time = now
 
-            raw_scaled = upscale_gray_to_bgr(visual_out)
+            # upscale once; write() copies the frame, so overlays can then be
+            # drawn onto the same buffer for the tracked video
+            raw_scaled = upscale_gray_to_bgr(visual_out, scratch_bgr, scratch_gray_big)
             raw_out.write(raw_scaled)
 
-            trk_scaled = upscale_gray_to_bgr(visual_out)
+            trk_scaled = raw_scaled
             for tid, t in visible:
                 x, y, w, h = t["bbox"]
                 color = t["color"]
@@ -635,7 +998,7 @@ def main():
                 )
 
                 label = f"ID{tid}"
-                (tw, th), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)
+                tw, th = t["label_sz"]
                 lx = xs + ws - tw - 6
                 ly = ys + hs - 6
 
@@ -669,6 +1032,9 @@ def main():
 
                 print(f"{COL_RECORD}[RECORD]{COL_RESET} STOP {recording_label} | LENGTH:{rec_len}")
 
+        # publish any status change the rate limit held back
+        write_status(recording, events_count)
+
         # ---------------- OPTIONAL LIVE DISPLAY (currently disabled) ----------------
         if HAS_DISPLAY:
             display = cv2.resize(
@@ -731,14 +1097,17 @@ def main():
             last_objects_present = objects_present
             last_recording_state = recording
 
+        # headless: cap.read() already paces the loop at the camera rate
         if HAS_DISPLAY:
             if cv2.waitKey(1) & 0xFF == ord("q"):
                 log_info("Exit requested.")
                 break
-        else:
-            time.sleep(0.001)
 
     cap.release()
+    if raw_out:
+        raw_out.release()
+    if trk_out:
+        trk_out.release()
     if HAS_DISPLAY:
         cv2.destroyAllWindows()
     log_info("Shut down cleanly.")
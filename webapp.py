@@ -1,28 +1,84 @@
 #!/usr/bin/env python3
+GEVENT_PATCHED = False
+if __name__ == "__main__":
+    # gevent (optional) has to patch the stdlib before anything else is
+    # imported. Threads and queues stay native; blocking file I/O runs on
+    # gevent's own thread pool (_IO_POOL) so waiting for it yields to
+    # the hub.
+    try:
+        from gevent import monkey
+        monkey.patch_all(thread=False, queue=False)
+        GEVENT_PATCHED = True
+    except ImportError:
+        pass
+
 import os
+import errno
 import time
 import json
+import io
 import zipfile
-import tempfile
+import mimetypes
+import mmap
+import re
+import struct
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+    HAS_INOTIFY = True
+except ImportError:
+    HAS_INOTIFY = False
+
+try:
+    from liburing import (
+        Ring, Cqe, io_uring_queue_init, io_uring_queue_exit,
+        io_uring_get_sqe, io_uring_prep_unlink, io_uring_sqe_set_data64,
+        io_uring_submit, io_uring_sq_ready, io_uring_wait_cqe,
+        io_uring_cq_ready, io_uring_cq_advance,
+    )
+    HAS_LIBURING = True
+except ImportError:
+    HAS_LIBURING = False
 
 from flask import (
     Flask, Response, send_from_directory,
-    render_template_string, abort, redirect, url_for,
-    send_file, after_this_request, request, jsonify
+    abort, redirect, url_for,
+    request, jsonify, make_response, stream_with_context
 )
+from jinja2 import ChoiceLoader, DictLoader
 
 # Paths must match main.py
 MEDIA_ROOT = "/home/kasper/media"
 PHOTO_DIR = os.path.join(MEDIA_ROOT, "photos")
 VIDEO_DIR = os.path.join(MEDIA_ROOT, "videos")
 VIDEO_TRACKED_DIR = os.path.join(MEDIA_ROOT, "videos_tracked")
-LIVE_JPEG_PATH = os.path.join(MEDIA_ROOT, "live.jpg")
+RUNTIME_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else MEDIA_ROOT
+LIVE_JPEG_PATH = os.path.join(RUNTIME_DIR, "trailcam_live.jpg")
+
+# URL folder name -> directory, for view/download/delete
+_FOLDER_MAP = MappingProxyType({
+    "photos": PHOTO_DIR,
+    "videos": VIDEO_DIR,
+    "videos_tracked": VIDEO_TRACKED_DIR,
+})
+# File names view/download/delete accept (use fullmatch): one path
+# component without NUL and no leading dot, so ".", "..", subpaths and
+# dotfiles never reach the filesystem. Spaces, non-ASCII etc. are fine.
+# safe_list applies the same test, so every listed file has working links.
+_SAFE_NAME = re.compile(r"[^./\x00][^/\x00]*")
 
 # Background reset flag watched by main.py
 RESET_FLAG_PATH = "/tmp/trailcam_reset_bg"
 
 # Status file written by main.py
-STATUS_PATH = os.path.join(MEDIA_ROOT, "status.json")
+STATUS_PATH = os.path.join(RUNTIME_DIR, "trailcam_status.json")
+# Shared-memory copy of the status (layout defined in main.py)
+STATUS_SHM_PATH = os.path.join(RUNTIME_DIR, "trailcam_status")
+STATUS_SHM_FMT = "<BxxxI"
+STATUS_SHM_SIZE = 16
 
 # Network state + desired-mode files used by trailcam_netmgr.py
 NET_STATE_PATH = "/run/trailcam_net_state.json"
@@ -31,6 +87,56 @@ DESIRED_MODE_PATH = "/run/trailcam_desired_mode.json"
 # Armed/disarmed state (shared with main.py)
 ARMED_STATE_PATH = os.path.join(MEDIA_ROOT, "armed_state.json")
 
+# When nginx fronts the app (config/nginx-trailcam.conf.example), set this
+# to its internal location so view/download hand the file to nginx via
+# X-Accel-Redirect and it is sent with sendfile(2) instead of via Python.
+# None = serve files from Flask directly.
+X_ACCEL_PREFIX = None  # e.g. "/_protected"
+
+# Public nginx location serving the media folders directly (ETag
+# revalidation, no long-lived caching). When set, file-browser "view" links point there and never
+# touch Flask. None = link to the view_file route.
+MEDIA_URL_PREFIX = None  # e.g. "/media"
+
+# Read size when streaming files into the "download all" ZIP
+ZIP_CHUNK_SIZE = 1024 * 1024
+# Archive bytes collected before handing a block to the response
+ZIP_FLUSH_SIZE = 4 * 1024 * 1024
+
+# Worker threads for blocking file I/O ("delete all" unlinks, /files scans)
+IO_WORKERS = 8
+# unlinkat requests submitted per io_uring batch (liburing installed)
+URING_BATCH = 128
+
+# Under gevent a concurrent.futures wait would block the whole hub (and
+# its workers cannot use patched queues), so use gevent's pool there.
+if GEVENT_PATCHED:
+    from gevent.threadpool import ThreadPool
+    _IO_POOL = ThreadPool(IO_WORKERS)
+else:
+    _IO_POOL = ThreadPoolExecutor(max_workers=IO_WORKERS)
+
+def _run_io(fn, *args):
+    """
+    Call a blocking fn(*args) so it doesn't stall other clients: on
+    _IO_POOL under gevent (the request greenlet yields while waiting),
+    inline otherwise (every request already has its own thread).
+    """
+    if not GEVENT_PATCHED:
+        return fn(*args)
+
+    # hand exceptions back instead of raising in the worker, which would
+    # also make gevent print a traceback
+    def call():
+        try:
+            return fn(*args), None
+        except Exception as e:
+            return None, e
+
+    result, err = _IO_POOL.apply(call)
+    if err is not None:
+        raise err
+    return result
 
 app = Flask(__name__)
 
@@ -38,29 +144,22 @@ app = Flask(__name__)
 # HTML TEMPLATES
 # --------------------------------------------------------------------
 
-HTML_INDEX = """
+HTML_BASE = """
 <!doctype html>
 <html>
 <head>
   <meta charset="utf-8">
-  <title>Trailcam Live</title>
+  <title>{% block title %}Trailcam{% endblock %}</title>
   <meta name="viewport" content="width=device-width, initial-scale=1.0">
   <style>
-    body { margin:0; background:#000; color:#fff; font-family:sans-serif; }
-    .wrap { display:flex; flex-direction:column; min-height:100vh; }
-    .top { flex:1; display:flex; align-items:center; justify-content:center; background:#000; }
-    .top img { width:100%; height:100%; object-fit:contain; }
-    .bot { padding:10px; background:#111; }
     a, a:visited { color:#6cf; text-decoration:none; }
     a:hover { text-decoration:underline; }
-    .btn-row { margin-bottom:10px; display:flex; flex-wrap:wrap; gap:8px; align-items:center; }
+    form { display:inline; margin:0; }
     .btn {
-      display:inline-block; padding:8px 12px;
+      display:inline-block;
       background:#222; border-radius:6px; border:0;
       color:#6cf; cursor:pointer;
     }
-    form { display:inline; margin:0; }
-    .status { margin-top:8px; font-size:0.85rem; color:#aaa; }
     .btn-armed {
       background:#063;
       color:#cfc;
@@ -69,7 +168,30 @@ HTML_INDEX = """
       background:#600;
       color:#fcc;
     }
+{% block extra_css %}{% endblock %}
   </style>
+{% block head %}{% endblock %}
+</head>
+<body>
+{% block content %}{% endblock %}
+</body>
+</html>
+"""
+
+HTML_INDEX = """
+{% extends "base.html" %}
+{% block title %}Trailcam Live{% endblock %}
+{% block extra_css %}
+    body { margin:0; background:#000; color:#fff; font-family:sans-serif; }
+    .wrap { display:flex; flex-direction:column; min-height:100vh; }
+    .top { flex:1; display:flex; align-items:center; justify-content:center; background:#000; }
+    .top img { width:100%; height:100%; object-fit:contain; }
+    .bot { padding:10px; background:#111; }
+    .btn-row { margin-bottom:10px; display:flex; flex-wrap:wrap; gap:8px; align-items:center; }
+    .btn { padding:8px 12px; }
+    .status { margin-top:8px; font-size:0.85rem; color:#aaa; }
+{% endblock %}
+{% block head %}
   <script>
     async function syncTime() {
       try {
@@ -101,8 +223,8 @@ HTML_INDEX = """
     // If you want automatic sync when page loads, uncomment this:
     // window.addEventListener("load", syncTime);
   </script>
-</head>
-<body>
+{% endblock %}
+{% block content %}
   <div class="wrap">
     <div class="top">
       <img src="{{ url_for('stream') }}" alt="Live">
@@ -132,47 +254,27 @@ HTML_INDEX = """
       </div>
     </div>
   </div>
-</body>
-</html>
+{% endblock %}
 """
 
 HTML_FILES = """
-<!doctype html>
-<html>
-<head>
-  <meta charset="utf-8">
-  <title>Trailcam Files</title>
-  <meta name="viewport" content="width=device-width, initial-scale=1.0">
-  <style>
+{% extends "base.html" %}
+{% block title %}Trailcam Files{% endblock %}
+{% block extra_css %}
     body { background:#000; color:#fff; font-family:sans-serif; padding:10px; }
     h2 { margin-top:20px; }
-    a, a:visited { color:#6cf; text-decoration:none; }
-    a:hover { text-decoration:underline; }
     ul { list-style:none; padding-left:0; }
     li { margin:4px 0; }
     .delbtn { margin-left:8px; padding:2px 6px; border-radius:4px; border:0; background:#700; color:#fff; cursor:pointer; font-size:0.8rem; }
     .dlbtn { margin-left:8px; padding:2px 6px; border-radius:4px; border:0; background:#246; color:#fff; cursor:pointer; font-size:0.8rem; text-decoration:none; }
-    form { display:inline; margin:0; }
     .footer { margin-top:20px; font-size:0.85rem; color:#aaa; }
     .warn { font-size:0.85rem; color:#faa; margin-top:4px; }
     .big-del { margin:10px 0; padding:6px 10px; border-radius:6px; border:0; background:#900; color:#fff; cursor:pointer; }
     .status { font-size:0.85rem; color:#aaa; margin-bottom:10px; }
-    .btn {
-      display:inline-block; padding:6px 10px;
-      background:#222; border-radius:6px; border:0;
-      color:#6cf; cursor:pointer;
-    }
-    .btn-armed {
-      background:#063;
-      color:#cfc;
-    }
-    .btn-disarmed {
-      background:#600;
-      color:#fcc;
-    }
-  </style>
-</head>
-<body>
+    .meta { margin-left:6px; font-size:0.8rem; color:#888; }
+    .btn { padding:6px 10px; }
+{% endblock %}
+{% block content %}
   <h1>Trailcam Files</h1>
 
   <p class="status">
@@ -215,9 +317,10 @@ HTML_FILES = """
   <ul>
     {% for f in videos %}
     <li>
-      <a href="{{ url_for('view_file', folder='videos', fname=f) }}">{{ f }}</a>
-      <a class="dlbtn" href="{{ url_for('download', folder='videos', fname=f) }}">Download</a>
-      <form method="post" action="{{ url_for('delete_file', folder='videos', fname=f) }}">
+      <a href="{{ media_url('videos', f.name) }}">{{ f.name }}</a>
+      <span class="meta">{{ f.size | filesizeformat }}</span>
+      <a class="dlbtn" href="{{ url_for('download', folder='videos', fname=f.name) }}">Download</a>
+      <form method="post" action="{{ url_for('delete_file', folder='videos', fname=f.name) }}">
         <button class="delbtn" type="submit">Delete</button>
       </form>
     </li>
@@ -234,9 +337,10 @@ HTML_FILES = """
   <ul>
     {% for f in videos_trk %}
     <li>
-      <a href="{{ url_for('view_file', folder='videos_tracked', fname=f) }}">{{ f }}</a>
-      <a class="dlbtn" href="{{ url_for('download', folder='videos_tracked', fname=f) }}">Download</a>
-      <form method="post" action="{{ url_for('delete_file', folder='videos_tracked', fname=f) }}">
+      <a href="{{ media_url('videos_tracked', f.name) }}">{{ f.name }}</a>
+      <span class="meta">{{ f.size | filesizeformat }}</span>
+      <a class="dlbtn" href="{{ url_for('download', folder='videos_tracked', fname=f.name) }}">Download</a>
+      <form method="post" action="{{ url_for('delete_file', folder='videos_tracked', fname=f.name) }}">
         <button class="delbtn" type="submit">Delete</button>
       </form>
     </li>
@@ -253,9 +357,10 @@ HTML_FILES = """
   <ul>
     {% for f in photos %}
     <li>
-      <a href="{{ url_for('view_file', folder='photos', fname=f) }}">{{ f }}</a>
-      <a class="dlbtn" href="{{ url_for('download', folder='photos', fname=f) }}">Download</a>
-      <form method="post" action="{{ url_for('delete_file', folder='photos', fname=f) }}">
+      <a href="{{ media_url('photos', f.name) }}">{{ f.name }}</a>
+      <span class="meta">{{ f.size | filesizeformat }}</span>
+      <a class="dlbtn" href="{{ url_for('download', folder='photos', fname=f.name) }}">Download</a>
+      <form method="post" action="{{ url_for('delete_file', folder='photos', fname=f.name) }}">
         <button class="delbtn" type="submit">Delete</button>
       </form>
     </li>
@@ -271,19 +376,77 @@ HTML_FILES = """
     Events this run: {{ events }} &nbsp;|&nbsp;
     Recording: {{ "ON" if recording else "OFF" }}
   </div>
-</body>
-</html>
+{% endblock %}
 """
 
+@app.template_global()
+def media_url(folder, fname):
+    """URL the file browser uses to open a media file inline."""
+    if MEDIA_URL_PREFIX:
+        return f"{MEDIA_URL_PREFIX}/{folder}/{quote(fname)}"
+    return url_for("view_file", folder=folder, fname=fname)
+
+# Both pages extend one base template, served from a DictLoader in front
+# of Flask's own loader. Compiled once at import on Flask's Jinja env
+# (keeps url_for etc.); routes call .render() directly. The .html names
+# keep Flask's autoescaping on.
+app.jinja_env.loader = ChoiceLoader([
+    DictLoader({
+        "base.html": HTML_BASE,
+        "index.html": HTML_INDEX,
+        "files.html": HTML_FILES,
+    }),
+    app.jinja_env.loader,
+])
+T_INDEX = app.jinja_env.get_template("index.html")
+T_FILES = app.jinja_env.get_template("files.html")
+
 # --------------------------------------------------------------------
 # HELPERS
 # --------------------------------------------------------------------
 
+# path -> ((mtime_ns, size, inode), parsed JSON)
+_json_cache = {}
+
+def read_json_cached(path):
+    """
+    json.load() the file at path, reusing the last parse while the file's
+    mtime/size/inode are unchanged (one stat() instead of open + parse).
+    Raises like open()/json.load() do.
+    """
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size, st.st_ino)
+    hit = _json_cache.get(path)
+    if hit is not None and hit[0] == key:
+        return hit[1]
+    with open(path, "r") as f:
+        data = json.load(f)
+    _json_cache[path] = (key, data)
+    return data
+
+_status_shm = None
+
 def get_status():
-    """Read status.json written by main.py."""
+    """
+    Read recording/events published by main.py: straight from the
+    shared-memory record once it exists, else from the status JSON.
+    """
+    global _status_shm
+    if _status_shm is None:
+        try:
+            fd = os.open(STATUS_SHM_PATH, os.O_RDONLY)
+            try:
+                _status_shm = mmap.mmap(fd, STATUS_SHM_SIZE, prot=mmap.PROT_READ)
+            finally:
+                os.close(fd)
+        except Exception:
+            pass
+    if _status_shm is not None:
+        recording, events = struct.unpack_from(STATUS_SHM_FMT, _status_shm, 0)
+        return bool(recording), events
+
     try:
-        with open(STATUS_PATH, "r") as f:
-            data = json.load(f)
+        data = read_json_cached(STATUS_PATH)
         recording = bool(data.get("recording", False))
         events = int(data.get("events", 0))
     except Exception:
@@ -294,8 +457,7 @@ def get_status():
 def get_net_state():
     """Read mode info written by trailcam_netmgr.py (kept for compatibility)."""
     try:
-        with open(NET_STATE_PATH, "r") as f:
-            data = json.load(f)
+        data = read_json_cached(NET_STATE_PATH)
         mode = data.get("mode", "unknown")
         signal = data.get("signal_dbm")
     except Exception:
@@ -304,11 +466,21 @@ def get_net_state():
     return mode, signal
 
 def set_desired_mode(mode):
-    """Write desired mode for trailcam_netmgr.py to pick up."""
-    data = {"desired": mode, "timestamp": time.time()}
+    """
+    Write desired mode for trailcam_netmgr.py to pick up. Written to a
+    temp file and renamed into place so the reader never sees a partial
+    file. mode is one of our fixed names, so no JSON encoder is needed.
+    """
+    payload = f'{{"desired": "{mode}", "timestamp": {time.time()}}}'.encode()
+    tmp_path = DESIRED_MODE_PATH + ".tmp"
     try:
-        with open(DESIRED_MODE_PATH, "w") as f:
-            json.dump(data, f)
+        fd = os.open(tmp_path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, payload)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.rename(tmp_path, DESIRED_MODE_PATH)
     except Exception:
         pass
 
@@ -318,8 +490,7 @@ def read_armed_state(default=True):
     If file does not exist or is invalid, returns default and writes it once.
     """
     try:
-        with open(ARMED_STATE_PATH, "r") as f:
-            data = json.load(f)
+        data = read_json_cached(ARMED_STATE_PATH)
         return bool(data.get("armed", default))
     except Exception:
         write_armed_state(default)
@@ -338,24 +509,196 @@ def write_armed_state(armed: bool):
     except Exception:
         pass
 
+def x_accel_response(folder, fname, as_attachment):
+    """
+    Empty response asking nginx to serve <folder>/<fname> itself.
+    fname must already have passed _SAFE_NAME.
+    """
+    resp = make_response("")
+    resp.headers["X-Accel-Redirect"] = f"{X_ACCEL_PREFIX}/{folder}/{quote(fname)}"
+    resp.mimetype = mimetypes.guess_type(fname)[0] or "application/octet-stream"
+    if as_attachment:
+        # RFC 6266 form: names may contain quotes or non-latin-1 text
+        resp.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(fname)}"
+    return resp
+
+def _safe_unlink(path):
+    try:
+        os.remove(path)
+    except Exception:
+        # Ignore individual file errors, keep going
+        pass
+
+def _uring_unlink_all(paths):
+    """
+    Unlink paths through io_uring, URING_BATCH requests per submit, so the
+    kernel works through each batch without a syscall round-trip per file.
+    Returns the paths that failed for any reason other than already being
+    gone, for the caller to retry with plain unlink(). Raises OSError if
+    the ring cannot be set up (old kernel, seccomp), or if the whole first
+    batch is rejected as unsupported (io_uring without UNLINKAT, < 5.11),
+    so the caller can fall back for all paths.
+    """
+    ring = Ring()
+    cqe = Cqe()
+    failed = []
+    io_uring_queue_init(URING_BATCH, ring)
+    try:
+        for i in range(0, len(paths), URING_BATCH):
+            batch = paths[i:i + URING_BATCH]
+            for k, path in enumerate(batch):
+                sqe = io_uring_get_sqe(ring)
+                io_uring_prep_unlink(sqe, path)
+                io_uring_sqe_set_data64(sqe, k)
+            # submission stops after an SQE the kernel rejects (its error
+            # still arrives as a CQE); resubmit until the queue is empty
+            while io_uring_sq_ready(ring):
+                if not io_uring_submit(ring):
+                    raise OSError(errno.EIO, "io_uring submit stalled")
+            errors = []
+            done = 0
+            while done < len(batch):
+                io_uring_wait_cqe(ring, cqe)
+                ready = io_uring_cq_ready(ring)
+                for k in range(ready):
+                    entry = cqe[k]
+                    # this binding raises OSError for a negative result;
+                    # still check the value in case a version returns it
+                    try:
+                        res = entry.res
+                    except OSError as e:
+                        errors.append((entry.user_data, e.errno))
+                        continue
+                    if res is not None and res < 0:
+                        errors.append((entry.user_data, -res))
+                io_uring_cq_advance(ring, ready)
+                done += ready
+            if i == 0 and len(errors) == len(batch) and all(
+                err in (errno.EINVAL, errno.EOPNOTSUPP) for _, err in errors
+            ):
+                raise OSError(errno.EOPNOTSUPP, "io_uring unlinkat unsupported")
+            failed.extend(batch[k] for k, err in errors if err != errno.ENOENT)
+    finally:
+        io_uring_queue_exit(ring)
+    return failed
+
+def safe_list(path):
+    """
+    Files in path, newest name first, as dicts with name/size/mtime.
+    One scandir pass: the file-type check comes from the dirent.
+    """
+    entries = []
+    try:
+        with os.scandir(path) as it:
+            for e in it:
+                if not e.is_file(follow_symlinks=False):
+                    continue
+                if not _SAFE_NAME.fullmatch(e.name):
+                    continue
+                st = e.stat(follow_symlinks=False)
+                entries.append({"name": e.name, "size": st.st_size, "mtime": st.st_mtime})
+    except OSError:
+        return []
+    entries.sort(key=lambda e: e["name"], reverse=True)
+    return entries
+
+class ZipStreamSink(io.RawIOBase):
+    """
+    Write-only, unseekable file object for zipfile.ZipFile: collects the
+    archive bytes so a streaming response can hand them out piecewise.
+    STORED payload blocks arrive as the very bytes objects read from the
+    source file and are passed on without another copy; only the small
+    pieces in between (headers, descriptors, small photos) get joined.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self.pending = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self.pending += len(b)
+        return len(b)
+
+    def take(self):
+        """Pending archive bytes as a list of blocks, in order."""
+        blocks, run = [], []
+        for c in self._chunks:
+            if len(c) >= ZIP_CHUNK_SIZE:
+                if run:
+                    blocks.append(b"".join(run))
+                    run = []
+                blocks.append(c)
+            else:
+                run.append(c)
+        if run:
+            blocks.append(b"".join(run))
+        self._chunks.clear()
+        self.pending = 0
+        return blocks
+
 # --------------------------------------------------------------------
 # MJPEG STREAM
 # --------------------------------------------------------------------
 
+MJPEG_PART_HEADER = b"--frame\r\nContent-Type: image/jpeg\r\n\r\n"
+
+def read_live_part(last_mtime_ns):
+    """
+    Return (multipart_chunk, mtime_ns) if the live JPEG changed since
+    last_mtime_ns, otherwise (None, last_mtime_ns). The JPEG is mmapped
+    and joined straight into the chunk: one copy instead of a read()
+    plus concatenations.
+    """
+    try:
+        fd = os.open(LIVE_JPEG_PATH, os.O_RDONLY)
+    except OSError:
+        return None, last_mtime_ns
+    try:
+        st = os.fstat(fd)
+        if st.st_mtime_ns == last_mtime_ns or st.st_size == 0:
+            return None, last_mtime_ns
+        with mmap.mmap(fd, st.st_size, access=mmap.ACCESS_READ) as mm:
+            part = b"".join((MJPEG_PART_HEADER, mm, b"\r\n"))
+        return part, st.st_mtime_ns
+    except Exception:
+        return None, last_mtime_ns
+    finally:
+        os.close(fd)
+
 def mjpeg_generator():
-    """Stream the latest JPEG as MJPEG."""
-    while True:
-        if os.path.exists(LIVE_JPEG_PATH):
-            try:
-                with open(LIVE_JPEG_PATH, "rb") as f:
-                    frame = f.read()
-                if frame:
-                    yield (b"--frame\r\n"
-                           b"Content-Type: image/jpeg\r\n\r\n" +
-                           frame + b"\r\n")
-            except Exception:
-                pass
-        time.sleep(0.1)  # ~10 fps
+    """
+    Stream the latest JPEG as MJPEG, one part per new frame. With inotify
+    we sleep in the kernel until main.py renames a new frame into place;
+    otherwise fall back to polling at ~10 fps.
+    """
+    watcher = None
+    if HAS_INOTIFY:
+        try:
+            watcher = INotify()
+            watcher.add_watch(os.path.dirname(LIVE_JPEG_PATH),
+                              inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO)
+        except OSError:
+            watcher = None
+
+    last_mtime_ns = None
+    try:
+        while True:
+            part, last_mtime_ns = read_live_part(last_mtime_ns)
+            if part:
+                yield part
+            if watcher is not None:
+                # other files in the directory may wake us too; the mtime
+                # check above filters those out
+                watcher.read(timeout=1000)
+            else:
+                time.sleep(0.1)  # ~10 fps
+    finally:
+        if watcher is not None:
+            watcher.close()
 
 # --------------------------------------------------------------------
 # ROUTES
@@ -367,8 +710,7 @@ def index():
     # net_mode, net_signal still read if you ever want them later.
     net_mode, net_signal = get_net_state()
     armed = read_armed_state(default=True)
-    return render_template_string(
-        HTML_INDEX,
+    return T_INDEX.render(
         recording=recording,
         events=events,
         net_mode=net_mode,
@@ -392,21 +734,21 @@ def stream():
 
 @app.route("/files")
 def files():
-    def safe_list(path):
-        if not os.path.isdir(path):
-            return []
-        return sorted(os.listdir(path), reverse=True)
-
-    videos = safe_list(VIDEO_DIR)
-    videos_trk = safe_list(VIDEO_TRACKED_DIR)
-    photos = safe_list(PHOTO_DIR)
+    # the three folder scans are independent SD-card I/O: overlap them so
+    # the page waits for the slowest, not the sum. The state reads are
+    # shared memory / cached tmpfs files and stay inline.
+    videos, videos_trk, photos = _IO_POOL.map(
+        safe_list, [VIDEO_DIR, VIDEO_TRACKED_DIR, PHOTO_DIR]
+    )
 
     recording, events = get_status()
     net_mode, net_signal = get_net_state()
     armed = read_armed_state(default=True)
 
-    return render_template_string(
-        HTML_FILES,
+    # Stream the page: the head and first rows go out while Jinja is still
+    # rendering the rest of a long listing. Buffering joins Jinja's tiny
+    # fragments into fewer, larger chunks.
+    page = T_FILES.stream(
         photos=photos,
         videos=videos,
         videos_trk=videos_trk,
@@ -416,98 +758,103 @@ def files():
         net_signal=net_signal,
         armed=armed,
     )
+    page.enable_buffering(64)
+    return Response(stream_with_context(page), mimetype="text/html")
 
 @app.route("/view/<folder>/<path:fname>")
 def view_file(folder, fname):
     """Inline preview: clicking the filename opens the media for viewing."""
-    folder_map = {
-        "photos": PHOTO_DIR,
-        "videos": VIDEO_DIR,
-        "videos_tracked": VIDEO_TRACKED_DIR,
-    }
-    base = folder_map.get(folder)
-    if base is None:
+    base = _FOLDER_MAP.get(folder)
+    if base is None or not _SAFE_NAME.fullmatch(fname):
         abort(404)
+    if X_ACCEL_PREFIX:
+        return x_accel_response(folder, fname, as_attachment=False)
     # as_attachment=False so browser tries to play / show it
     return send_from_directory(base, fname, as_attachment=False)
 
 @app.route("/download/<folder>/<path:fname>")
 def download(folder, fname):
     """Download: Download button always triggers a save dialog."""
-    folder_map = {
-        "photos": PHOTO_DIR,
-        "videos": VIDEO_DIR,
-        "videos_tracked": VIDEO_TRACKED_DIR,
-    }
-    base = folder_map.get(folder)
-    if base is None:
+    base = _FOLDER_MAP.get(folder)
+    if base is None or not _SAFE_NAME.fullmatch(fname):
         abort(404)
+    if X_ACCEL_PREFIX:
+        return x_accel_response(folder, fname, as_attachment=True)
     return send_from_directory(base, fname, as_attachment=True)
 
 @app.route("/download_all_media")
 def download_all_media():
     """
-    Create a ZIP containing all media (photos, videos, tracked videos)
-    and return it as a download.
+    Stream a ZIP containing all media (photos, videos, tracked videos).
+    Members are STORED (MP4/JPEG are already compressed) and bytes are
+    sent as each file is read, so nothing is staged on disk.
     """
-    # Temporary ZIP file
-    tmp = tempfile.NamedTemporaryFile(suffix=".zip", delete=False)
-    tmp_path = tmp.name
-    tmp.close()
-
     dir_specs = [
         (PHOTO_DIR, "photos"),
         (VIDEO_DIR, "videos"),
         (VIDEO_TRACKED_DIR, "videos_tracked"),
     ]
 
-    with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zf:
-        for folder_path, arc_prefix in dir_specs:
-            if not os.path.isdir(folder_path):
-                continue
-            for name in os.listdir(folder_path):
-                full = os.path.join(folder_path, name)
-                if os.path.isfile(full):
+    def generate():
+        sink = ZipStreamSink()
+        with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED, allowZip64=True) as zf:
+            for folder_path, arc_prefix in dir_specs:
+                if not os.path.isdir(folder_path):
+                    continue
+                for name in os.listdir(folder_path):
+                    full = os.path.join(folder_path, name)
+                    if not os.path.isfile(full):
+                        continue
                     arcname = os.path.join(arc_prefix, name)
                     try:
-                        zf.write(full, arcname=arcname)
+                        zinfo = zipfile.ZipInfo.from_file(full, arcname=arcname)
+                        # unbuffered: each read is one syscall straight into
+                        # the bytes object that ends up in the response
+                        src = open(full, "rb", buffering=0)
                     except Exception:
                         # skip problematic file, continue
+                        continue
+                    try:
+                        os.posix_fadvise(src.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                    except Exception:
                         pass
-
-    @after_this_request
-    def remove_file(response):
-        try:
-            os.remove(tmp_path)
-        except Exception:
-            pass
-        return response
-
-    return send_file(
-        tmp_path,
-        as_attachment=True,
-        download_name="trailcam_all_media.zip",
+                    with src, zf.open(zinfo, "w") as dst:
+                        while True:
+                            chunk = _run_io(src.read, ZIP_CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            dst.write(chunk)
+                            if sink.pending >= ZIP_FLUSH_SIZE:
+                                yield from sink.take()
+        # trailing data descriptor + central directory
+        yield from sink.take()
+
+    return Response(
+        generate(),
         mimetype="application/zip",
+        headers={
+            "Content-Disposition": 'attachment; filename="trailcam_all_media.zip"',
+            # behind nginx: pass the stream through instead of spooling a
+            # multi-GB archive into proxy_temp on the SD card
+            "X-Accel-Buffering": "no",
+        },
     )
 
 @app.route("/delete/<folder>/<path:fname>", methods=["POST"])
 def delete_file(folder, fname):
-    folder_map = {
-        "photos": PHOTO_DIR,
-        "videos": VIDEO_DIR,
-        "videos_tracked": VIDEO_TRACKED_DIR,
-    }
-    base = folder_map.get(folder)
-    if base is None:
+    base = _FOLDER_MAP.get(folder)
+    if base is None or not _SAFE_NAME.fullmatch(fname):
         abort(404)
 
     full_path = os.path.join(base, fname)
-    if not os.path.isfile(full_path):
-        abort(404)
-
+    # single syscall, no isfile()/remove() race; the errno says what failed
     try:
         os.remove(full_path)
-    except Exception:
+    except (FileNotFoundError, IsADirectoryError):
+        abort(404)
+    except PermissionError:
+        abort(403)
+    except OSError:
         abort(500)
     return redirect(url_for("files"))
 
@@ -528,26 +875,39 @@ def delete_all(target):
     if dirs is None:
         abort(404)
 
+    # one scandir pass per folder: is_file() and inode() come from the dirent
+    entries = []
     for d in dirs:
-        if not os.path.isdir(d):
+        try:
+            with os.scandir(d) as it:
+                entries.extend(
+                    (e.inode(), e.path) for e in it if e.is_file(follow_symlinks=False)
+                )
+        except OSError:
             continue
-        for name in os.listdir(d):
-            full = os.path.join(d, name)
-            if os.path.isfile(full):
-                try:
-                    os.remove(full)
-                except Exception:
-                    # Ignore individual file errors, keep going
-                    pass
+
+    # inode order keeps ext4 metadata updates local; parallel unlinks let
+    # the kernel batch the journal commits
+    entries.sort()
+    paths = [path for _, path in entries]
+    if HAS_LIBURING and paths:
+        try:
+            # leftovers (EBUSY, EPERM, ...) get a second try below
+            paths = _run_io(_uring_unlink_all, paths)
+        except Exception:
+            pass  # no usable io_uring: thread pool below
+    if paths:
+        list(_IO_POOL.map(_safe_unlink, paths))
 
     return redirect(url_for("files"))
 
 @app.route("/reset_background", methods=["POST"])
 def reset_background():
-    # Touch the flag file; main.py will see it and reset background
+    # Touch the flag file; main.py will see it and reset background.
+    # Only its existence matters (main.py deletes it, so utime() alone
+    # would fail): create it and write nothing.
     try:
-        with open(RESET_FLAG_PATH, "w") as f:
-            f.write("reset\n")
+        os.close(os.open(RESET_FLAG_PATH, os.O_CREAT | os.O_WRONLY, 0o644))
     except Exception:
         pass
     return redirect(url_for("index"))
@@ -615,5 +975,14 @@ def toggle_armed():
     return redirect(url_for("index"))
 
 if __name__ == "__main__":
-    # Listen on all interfaces, port 8000
-    app.run(host="0.0.0.0", port=8000, threaded=True)
+    # Listen on all interfaces, port 8000. Prefer gevent: each MJPEG viewer
+    # is then a greenlet instead of a dedicated OS thread.
+    try:
+        from gevent.pywsgi import WSGIServer
+    except ImportError:
+        WSGIServer = None
+
+    if WSGIServer is not None:
+        WSGIServer(("0.0.0.0", 8000), app).serve_forever()
+    else:
+        app.run(host="0.0.0.0", port=8000, threaded=True)